@@ -1,11 +1,20 @@
+import hashlib
+import importlib.util
+import os
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from prophet import Prophet
+from joblib import Parallel, delayed
+from prophet import Prophet, __version__ as PROPHET_VERSION
+
+# Copy-on-Write: subsets / renames stay lazy until written (always on from pandas 3.0)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.options.mode.copy_on_write = True
 
 # =============================
 # Config
 # =============================
-INPUT_XLSX_TWO         = Path("Biolage Sales Data.xlsx")
+INPUT_XLSX         = Path("Biolage Sales Data.xlsx")
 INPUT_SHEET        = "Raw Data_Cleaned"
 OUTPUT_XLSX        = Path("Biolage Sales Data_Filtered.xlsx")
 OUTPUT_ANALYTICAL  = Path("Analytical Table.xlsx")
@@ -15,12 +24,197 @@ OUTPUT_PROPHET_OUT = Path("Biolage Prophet Output.xlsx")
 # Toggles
 RUN_PROPHET_EXPORT = True   # Turn OFF → False to skip Prophet input file
 RUN_PROPHET_MODEL  = True   # Turn OFF → False to skip Prophet modeling
+PROPHET_N_JOBS     = -1     # Parallel Prophet fits (-1 → one worker per core)
+OUTPUT_FORMAT      = 'xlsx' # 'parquet' → Analytical / Prophet files as .parquet (QA file stays xlsx)
+
+# Prophet model settings + forecast horizon (days, like the R code)
+PROPHET_PARAMS     = {'yearly_seasonality': True, 'weekly_seasonality': True}
+PROPHET_PERIODS    = 365
+
+# Per-franchise forecasts are reused while the franchise's (ds, y) history and the settings above are unchanged
+PROPHET_CACHE_DIR  = Path(".prophet_cache") / PROPHET_VERSION
+
+# xlsxwriter workbook options (rows are written in order, so constant_memory can stream them)
+XLSX_OPTIONS = {
+    'constant_memory': True,
+    'strings_to_urls': False,
+    'strings_to_numbers': False,
+    'default_date_format': 'yyyy-mm-dd',
+}
+HAS_XLSXWRITER = importlib.util.find_spec('xlsxwriter') is not None
+
+# Excel reader: python-calamine (Rust) when installed, else openpyxl
+READ_ENGINE = 'calamine' if importlib.util.find_spec('python_calamine') else 'openpyxl'
+
+# Parsed input sheets are cached as parquet when pyarrow is installed
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+PARQUET_CACHE_DIR  = Path(".sheet_cache")
+
+
+# =============================
+# Helpers
+# =============================
+def load_sheet(path, sheet, skip_cols=()):
+    """Read one sheet of `path` minus `skip_cols`, via a parquet cache rebuilt when the xlsx is newer.
+
+    Without pyarrow, or when a column has no single parquet type, the xlsx is parsed every run.
+    """
+    def parse():
+        with pd.ExcelFile(path, engine=READ_ENGINE) as xls:
+            return xls.parse(sheet_name=sheet, usecols=lambda col: col not in skip_cols)
+
+    if not HAS_PYARROW:
+        return parse()
+
+    # Reader + column selection are part of the key → changing either never returns stale columns
+    key = hashlib.blake2b(repr((READ_ENGINE, sorted(skip_cols))).encode(), digest_size=4).hexdigest()
+    cache = PARQUET_CACHE_DIR / f"{path.stem}.{sheet}.{key}.parquet"
+    if cache.exists() and cache.stat().st_mtime >= path.stat().st_mtime:
+        return pd.read_parquet(cache, engine='pyarrow')
+
+    sheet_df = parse()
+
+    # Temp file + rename: an interrupted write never leaves a truncated cache behind
+    PARQUET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = cache.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        sheet_df.to_parquet(tmp, engine='pyarrow', compression='zstd')
+        os.replace(tmp, cache)
+    except (ValueError, TypeError, NotImplementedError):
+        # Mixed-type column → keep the parsed frame as-is, don't cache it
+        tmp.unlink(missing_ok=True)
+    return sheet_df
+
+
+def excel_rows(frame):
+    """Header + data rows of `frame` as plain Python tuples (NaN / NaT / pd.NA → empty cell).
+
+    Build once and pass the result to write_workbook for every workbook that shares the sheet.
+    """
+    body = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+    return (tuple(frame.columns), *body)
+
+
+def write_workbook(path, sheets):
+    """Write {sheet_name: block or [block, ...]} to `path`, one sheet per key.
+
+    A block is a DataFrame or the output of excel_rows(); blocks listed under one
+    sheet are stacked with two blank rows between them. Rows are streamed with
+    xlsxwriter when installed, else with an openpyxl write-only workbook.
+    """
+    sheet_rows = {}
+    for sheet_name, blocks in sheets.items():
+        rows = []
+        for i, block in enumerate(blocks if isinstance(blocks, list) else [blocks]):
+            if i:
+                rows += [(), ()]
+            rows += excel_rows(block) if isinstance(block, pd.DataFrame) else block
+        sheet_rows[sheet_name] = rows
+
+    if HAS_XLSXWRITER:
+        import xlsxwriter
+
+        with xlsxwriter.Workbook(path, XLSX_OPTIONS) as wb:
+            for sheet_name, rows in sheet_rows.items():
+                ws = wb.add_worksheet(sheet_name)
+                for r, row in enumerate(rows):
+                    ws.write_row(r, 0, row)
+        return
+
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    for sheet_name, rows in sheet_rows.items():
+        ws = wb.create_sheet(sheet_name)
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+
+
+def write_output(path, sheets, rows=None):
+    """Write a machine-facing output: xlsx via write_workbook, or one parquet file per sheet.
+
+    `rows` (sheet name → excel_rows) replaces `sheets` for xlsx when the rows are already built.
+    Returns the list of paths written.
+    """
+    if OUTPUT_FORMAT != 'parquet':
+        write_workbook(path, rows or sheets)
+        return [path]
+
+    written = []
+    for sheet_name, frame in sheets.items():
+        if len(sheets) == 1:
+            target = path.with_suffix('.parquet')
+        else:
+            target = path.with_name(f"{path.stem} - {sheet_name}.parquet")
+        frame.to_parquet(target, index=False)
+        written.append(target)
+    return written
+
+
+def fit_forecast(fr_id, df_group):
+    """Fit Prophet on one franchise's (ds, y) history and return its forecast frame."""
+    # Keep only the columns Prophet needs
+    prophet_df = df_group[['ds', 'y']].sort_values('ds')
+
+    # Cache key: franchise + model settings + the exact history bytes (hashed → safe filename)
+    digest = hashlib.blake2b(repr((fr_id, sorted(PROPHET_PARAMS.items()), PROPHET_PERIODS)).encode())
+    digest.update(prophet_df['ds'].to_numpy('datetime64[ns]').tobytes())
+    digest.update(prophet_df['y'].to_numpy('float64').tobytes())
+    cache = PROPHET_CACHE_DIR / f"{digest.hexdigest()[:32]}.parquet"
+
+    if HAS_PYARROW and cache.exists():
+        forecast = pd.read_parquet(cache)
+    else:
+        m = Prophet(**PROPHET_PARAMS)
+        m.fit(prophet_df)
+
+        # Future dataframe (365 days, like your R code) → predict
+        future = m.make_future_dataframe(periods=PROPHET_PERIODS)
+        forecast = m.predict(future)
+
+        if HAS_PYARROW:
+            # Temp file + rename: a killed worker never leaves a truncated cache entry
+            tmp = cache.with_suffix(f".{os.getpid()}.tmp")
+            forecast.to_parquet(tmp)
+            os.replace(tmp, cache)
+
+    # Ensure weekly/yearly columns exist (to mirror R safety)
+    if 'weekly' not in forecast.columns:
+        forecast['weekly'] = pd.NA
+    if 'yearly' not in forecast.columns:
+        forecast['yearly'] = pd.NA
+
+    # Add ID (Franchise) column
+    forecast['ID'] = fr_id
+
+    # Add an Index column similar to rownames in R
+    forecast = forecast.reset_index(drop=True)
+    forecast['Index'] = forecast.index
+
+    # Indexed by (ID, ds) so the combined forecasts join straight onto the dataset
+    return forecast.set_index(['ID', 'ds'])
+
+
+def safe_ratio(num, den):
+    """num / den as a float64 array, NaN where den is 0 or missing (one fused NumPy pass)."""
+    num = num.to_numpy(dtype='float64', na_value=np.nan)
+    den = den.to_numpy(dtype='float64', na_value=np.nan)
+    return np.divide(num, den, out=np.full_like(den, np.nan), where=den != 0)
+
+
+def null_and_negative_counts(col):
+    """(null count, negative count) of a numeric column, from one raw float64 array."""
+    arr = col.to_numpy(dtype='float64', na_value=np.nan)
+    return int(np.count_nonzero(np.isnan(arr))), int(np.count_nonzero(arr < 0))
 
 
 # =============================
 # Load Data
 # =============================
-df = pd.read_excel(INPUT_XLSX, sheet_name=INPUT_SHEET)
+# Raw 'Week' (mixed text/dates) is replaced by 'Week End' below → don't parse it.
+# Every other column stays: exact-duplicate removal compares whole rows.
+df = load_sheet(INPUT_XLSX, INPUT_SHEET, skip_cols=('Week',))
 
 # =============================
 # Date prep (remove time - NOT WORKING CORRECTLY)
@@ -30,15 +224,19 @@ if 'Week' in df.columns:
     df = df.drop(columns=['Week'])
 df = df.rename(columns={'Week End': 'Week'})
 
+# Low-cardinality key → category so dedup / groupbys hash int codes, not strings
+df['Franchise'] = df['Franchise'].astype('category')
+
 # =============================
 # Numeric hygiene
 # =============================
 df['ST_Units']    = pd.to_numeric(df['ST_Units'], errors='coerce')
 df['ST_Retail_$'] = pd.to_numeric(df['ST_Retail_$'], errors='coerce')
 
-# Remove exact duplicate rows
-dup_count_before = df.duplicated().sum()
+# Remove exact duplicate rows (count from the size difference → one hash pass)
+rows_before = len(df)
 df = df.drop_duplicates()
+dup_count_before = rows_before - len(df)
 
 # Sort newest → oldest
 df = df.sort_values('Week', ascending=False).reset_index(drop=True)
@@ -46,21 +244,19 @@ df = df.sort_values('Week', ascending=False).reset_index(drop=True)
 # =============================
 # Week Mapping (TTM / LY / PY)
 # =============================
-unique_weeks = sorted(df['Week'].dropna().unique(), reverse=True)
+# Dense rank of each row's week (0 = newest) → 52-week bucket; NaT weeks keep code -1 (no mapping)
+weeks = df['Week'].to_numpy()
+has_week = ~np.isnat(weeks)
+uniq_weeks, week_idx = np.unique(weeks[has_week], return_inverse=True)  # ascending
+week_rank = (len(uniq_weeks) - 1) - week_idx
 
-week_map = {}
-for i, wk in enumerate(unique_weeks):
-    if i < 52:
-        week_map[wk] = 'TTM'
-    elif i < 104:
-        week_map[wk] = 'LY'
-    else:
-        week_map[wk] = 'PY'
-
-df['Week Mapping'] = df['Week'].map(week_map)
+week_code = np.full(len(df), -1, dtype='int8')
+week_code[has_week] = np.minimum(week_rank // 52, 2)
+df['Week Mapping'] = pd.Categorical.from_codes(week_code, categories=['TTM', 'LY', 'PY'])
 
 # Include / Exclude flag
-df['Include'] = df['Week Mapping'].apply(lambda x: 'Include' if x in {'TTM', 'LY'} else 'Exclude')
+include_mask = df['Week Mapping'].isin(['TTM', 'LY']).to_numpy()
+df['Include'] = np.where(include_mask, 'Include', 'Exclude')
 
 # =============================
 # Subset + rename measures (keep only included)
@@ -70,62 +266,46 @@ if 'Year' in df.columns:  # pass through Year if it exists
     keep_cols.append('Year')
 
 df_out = (
-    df.loc[df['Include'] == 'Include', keep_cols]
+    df.loc[include_mask, keep_cols]
       .rename(columns={'ST_Retail_$': 'Sales', 'ST_Units': 'Units'})
-      .copy()
 )
 
 # Ensure Year exists for QA if it wasn't in source
 if 'Year' not in df_out.columns:
     df_out['Year'] = df_out['Week'].dt.year
 
-# =============================
-# Alteryx-like Summarize (Week Mapping × Franchise)
-# =============================
-summ_wm_fr = (
-    df_out.groupby(['Week Mapping', 'Franchise'], as_index=False)[['Sales', 'Units']].sum()
-)
+# Year is the remaining low-cardinality summary key (Franchise / Week Mapping already categorical)
+df_out['Year'] = df_out['Year'].astype('category')
 
 # =============================
-# Cross Tabs (Franchise rows; LY/TTM columns)
+# Alteryx-like Summarize + Cross Tabs (Franchise rows; LY/TTM columns)
 # =============================
-sales_ct = summ_wm_fr.pivot_table(
-    index='Franchise', columns='Week Mapping', values='Sales',
-    aggfunc='sum', fill_value=0
-)
-units_ct = summ_wm_fr.pivot_table(
-    index='Franchise', columns='Week Mapping', values='Units',
-    aggfunc='sum', fill_value=0
+# One groupby pass for both measures, spread Week Mapping across columns
+wide = (
+    df_out.groupby(['Franchise', 'Week Mapping'], observed=True)[['Sales', 'Units']].sum()
+          .unstack('Week Mapping', fill_value=0)
 )
+wide.columns = [f"{wm}_{meas}" for meas, wm in wide.columns]
 
-# Guarantee columns exist & order
-for pvt in (sales_ct, units_ct):
-    for col in ('LY', 'TTM'):
-        if col not in pvt.columns:
-            pvt[col] = 0
-    pvt.sort_index(axis=1, inplace=True)
+# Guarantee columns exist & order (missing period → zeros)
+wide = wide.reindex(columns=['LY_Sales', 'TTM_Sales', 'LY_Units', 'TTM_Units'], fill_value=0)
 
-# Rename for final output
-sales_ct = sales_ct[['LY', 'TTM']].rename(columns={'LY': 'LY_Sales', 'TTM': 'TTM_Sales'})
-units_ct = units_ct[['LY', 'TTM']].rename(columns={'LY': 'LY_Units', 'TTM': 'TTM_Units'})
+sales_ct = wide[['LY_Sales', 'TTM_Sales']]
+units_ct = wide[['LY_Units', 'TTM_Units']]
 
 # =============================
-# Analytical Table (merge Sales + Units)
+# Analytical Table (Sales + Units side by side)
 # =============================
-analytical_tbl = (
-    sales_ct.join(units_ct, how='outer')
-            .reset_index()  # Franchise
-            .fillna(0)
-)
+analytical_tbl = wide.reset_index()  # Franchise
 
 # YoY / Growth (TTM / LY - 1)
-analytical_tbl['Sales_Growth'] = (
-    (analytical_tbl['TTM_Sales'] - analytical_tbl['LY_Sales']) /
-    analytical_tbl['LY_Sales'].replace({0: pd.NA})
+analytical_tbl['Sales_Growth'] = safe_ratio(
+    analytical_tbl['TTM_Sales'] - analytical_tbl['LY_Sales'],
+    analytical_tbl['LY_Sales']
 )
-analytical_tbl['Units_Growth'] = (
-    (analytical_tbl['TTM_Units'] - analytical_tbl['LY_Units']) /
-    analytical_tbl['LY_Units'].replace({0: pd.NA})
+analytical_tbl['Units_Growth'] = safe_ratio(
+    analytical_tbl['TTM_Units'] - analytical_tbl['LY_Units'],
+    analytical_tbl['LY_Units']
 )
 
 # =============================
@@ -162,62 +342,64 @@ analytical_tbl = analytical_tbl.sort_values('TTM_Sales', ascending=False)
 # =============================
 # Week x Franchise, Sum Units & Sum Sales
 avg_price_tbl = (
-    df_out.groupby(['Week', 'Franchise'], as_index=False)
-          .agg(Sum_Units=('Units', 'sum'),
-               Sum_Sales=('Sales', 'sum'))
+    df_out.groupby(['Week', 'Franchise'], as_index=False, observed=True, sort=False)[['Units', 'Sales']].sum()
+          .rename(columns={'Units': 'Sum_Units', 'Sales': 'Sum_Sales'})
 )
 
-avg_price_tbl['Average_Price'] = (
-    avg_price_tbl['Sum_Sales'] /
-    avg_price_tbl['Sum_Units'].replace({0: pd.NA})
-)
+avg_price_tbl['Average_Price'] = safe_ratio(avg_price_tbl['Sum_Sales'], avg_price_tbl['Sum_Units'])
 
 # Sort by Week ascending, then Franchise
 avg_price_tbl = avg_price_tbl.sort_values(['Week', 'Franchise'])
 
 # Prophet input table (only if enabled)
 if RUN_PROPHET_EXPORT:
-    prophet_tbl = (
-        avg_price_tbl[['Week', 'Franchise', 'Sum_Units']]
-            .copy()
-    )
+    prophet_tbl = avg_price_tbl[['Week', 'Franchise', 'Sum_Units']]
 else:
     prophet_tbl = None
 
 # =============================
 # Extra QA tabs
 # =============================
-overall_units = df_out['Units'].sum()
-overall_sales = df_out['Sales'].sum()
+overall_units, overall_sales = np.nansum(
+    df_out[['Units', 'Sales']].to_numpy(dtype='float64', na_value=np.nan), axis=0
+)
 
 franchise_summary = (
-    df_out.groupby('Franchise', as_index=False)[['Units', 'Sales']].sum()
+    df_out.groupby('Franchise', as_index=False, observed=True, sort=False)[['Units', 'Sales']].sum()
           .sort_values('Sales', ascending=False)
 )
 
 year_summary = (
-    df_out.groupby('Year', as_index=False)[['Units', 'Sales']].sum()
+    df_out.groupby('Year', as_index=False, observed=True, sort=False)[['Units', 'Sales']].sum()
           .sort_values('Year')
 )
 
 wm_summary = (
-    df_out.groupby('Week Mapping', as_index=False)[['Units', 'Sales']].sum()
-          .sort_values('Week Mapping', ascending=False)
+    df_out.groupby('Week Mapping', as_index=False, observed=True, sort=False)[['Units', 'Sales']].sum()
+          .sort_values('Week Mapping')  # category order: TTM, LY, PY
 )
 
 weekly_summary = (
-    df_out.groupby('Week', as_index=False)[['Units', 'Sales']].sum()
+    df_out.groupby('Week', as_index=False, observed=True, sort=False)[['Units', 'Sales']].sum()
           .sort_values('Week', ascending=False)
 )
 
 # Data Quality
 dq_cols = ['Week', 'Franchise', 'ST_Retail_$', 'ST_Units', 'Year', 'Week Mapping']
 dq_cols = [c for c in dq_cols if c in df.columns]
-nulls = df[dq_cols].isna().sum(min_count=1)
-dq_nulls = nulls.to_frame(name='Null_Count').reset_index().rename(columns={'index': 'Column'})
+# Measures: nulls + negatives from one array per column
+measure_dq = {c: null_and_negative_counts(df[c]) for c in ('ST_Units', 'ST_Retail_$') if c in df.columns}
 
-neg_units = (df['ST_Units'] < 0).sum() if 'ST_Units' in df.columns else 0
-neg_sales = (df['ST_Retail_$'] < 0).sum() if 'ST_Retail_$' in df.columns else 0
+# Per-column counts → no full-size boolean frame
+dq_nulls = pd.DataFrame({
+    'Column': dq_cols,
+    'Null_Count': [measure_dq[c][0] if c in measure_dq else int(df[c].isna().sum()) for c in dq_cols]
+})
+
+neg_units = measure_dq['ST_Units'][1] if 'ST_Units' in measure_dq else 0
+neg_sales = measure_dq['ST_Retail_$'][1] if 'ST_Retail_$' in measure_dq else 0
+
+week_stats = df['Week'].agg(['min', 'max', 'nunique'])
 
 dq_summary = pd.DataFrame({
     'Metric': [
@@ -235,10 +417,10 @@ dq_summary = pd.DataFrame({
         int(dup_count_before),
         int(neg_units),
         int(neg_sales),
-        int(df['Week'].nunique()),
+        int(week_stats['nunique']),
         int(df_out['Week'].nunique()),
-        df['Week'].max(),
-        df['Week'].min(),
+        week_stats['max'],
+        week_stats['min'],
         f"{overall_units:,.0f}",
         f"${overall_sales:,.2f}"
     ]
@@ -249,50 +431,56 @@ dq_summary = pd.DataFrame({
 # =============================
 cols_final = ['Week', 'Week Mapping', 'Franchise', 'Sales', 'Units', 'Year', 'Include']
 
-with pd.ExcelWriter(OUTPUT_XLSX, engine='openpyxl') as writer:
+# Date-only weeks in both workbooks
+df_out['Week']        = df_out['Week'].dt.date
+avg_price_tbl['Week'] = avg_price_tbl['Week'].dt.date
+weekly_summary['Week'] = weekly_summary['Week'].dt.date
+
+# Sheets shared with "Analytical Table.xlsx" → serialize once, write twice
+shared_sheets = {
+    'Raw_Data': df_out[cols_final],
+    'Analytical_Table': analytical_tbl,
+    'Franchise_Summary': franchise_summary,
+    'Avg_Price': avg_price_tbl,
+}
+shared_rows = {name: excel_rows(frame) for name, frame in shared_sheets.items()}
+
+write_workbook(OUTPUT_XLSX, {
     # Raw included rows (for traceability)
-    df_out[cols_final].to_excel(writer, sheet_name='TTM_LY_Only', index=False)
+    'TTM_LY_Only': shared_rows['Raw_Data'],
 
     # Crosstabs like Alteryx
-    sales_ct.reset_index().to_excel(writer, sheet_name='CrossTab_Sales', index=False)
-    units_ct.reset_index().to_excel(writer, sheet_name='CrossTab_Units', index=False)
+    'CrossTab_Sales': sales_ct.reset_index(),
+    'CrossTab_Units': units_ct.reset_index(),
 
     # Final Analytical Table
-    analytical_tbl.to_excel(writer, sheet_name='Analytical_Table', index=False)
+    'Analytical_Table': shared_rows['Analytical_Table'],
 
     # QA tabs
-    franchise_summary.to_excel(writer, sheet_name='Franchise_Summary', index=False)
-    year_summary.to_excel(writer, sheet_name='Year_Summary', index=False)
-    wm_summary.to_excel(writer, sheet_name='WeekMapping_Summary', index=False)
-    weekly_summary.to_excel(writer, sheet_name='Weekly_Summary', index=False)
+    'Franchise_Summary': shared_rows['Franchise_Summary'],
+    'Year_Summary': year_summary,
+    'WeekMapping_Summary': wm_summary,
+    'Weekly_Summary': weekly_summary,
 
     # Avg price tab
-    avg_price_tbl.to_excel(writer, sheet_name='Avg_Price', index=False)
+    'Avg_Price': shared_rows['Avg_Price'],
 
-    # Data Quality
-    dq_summary.to_excel(writer, sheet_name='Data_Quality', index=False, startrow=0)
-    dq_nulls.to_excel(writer, sheet_name='Data_Quality', index=False, startrow=len(dq_summary) + 3)
+    # Data Quality (summary, then null counts below it)
+    'Data_Quality': [dq_summary, dq_nulls],
+})
 
 # =============================
 # Write SECOND Excel: "Analytical Table.xlsx"
 # Only: Raw_Data + Analytical_Table + Franchise_Summary + Avg_Price
 # =============================
-df_out['Week']        = df_out['Week'].dt.date
-avg_price_tbl['Week'] = avg_price_tbl['Week'].dt.date
-weekly_summary['Week'] = weekly_summary['Week'].dt.date
-
-with pd.ExcelWriter(OUTPUT_ANALYTICAL, engine='openpyxl') as writer2:
-    df_out[cols_final].to_excel(writer2, sheet_name='Raw_Data', index=False)
-    analytical_tbl.to_excel(writer2, sheet_name='Analytical_Table', index=False)
-    franchise_summary.to_excel(writer2, sheet_name='Franchise_Summary', index=False)
-    avg_price_tbl.to_excel(writer2, sheet_name='Avg_Price', index=False)
+analytical_paths = write_output(OUTPUT_ANALYTICAL, shared_sheets, rows=shared_rows)
 
 # =============================
 # Write THIRD Excel: Prophet INPUT (optional)
 # =============================
+prophet_in_paths, prophet_out_paths = [], []
 if RUN_PROPHET_EXPORT and prophet_tbl is not None:
-    with pd.ExcelWriter(OUTPUT_PROPHET_IN, engine='openpyxl') as writer3:
-        prophet_tbl.to_excel(writer3, sheet_name='Prophet_Input', index=False)
+    prophet_in_paths = write_output(OUTPUT_PROPHET_IN, {'Prophet_Input': prophet_tbl})
 
 # =============================
 # Prophet MODELING (optional)
@@ -318,57 +506,28 @@ if RUN_PROPHET_MODEL:
     # Optional: sort for safety
     dataset = dataset.sort_values(['ID', 'ds'])
 
-    # 2) Split by ID (Franchise)
-    franchise_groups = {fr_id: df for fr_id, df in dataset.groupby('ID')}
-
-    results = []
-
-    for fr_id, df_group in franchise_groups.items():
-        # Keep only the columns Prophet needs
-        prophet_df = df_group[['ds', 'y']].copy().sort_values('ds')
-
-        # 3) Fit Prophet model
-        m = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True
-        )
-        m.fit(prophet_df)
-
-        # 4) Create future dataframe (365 days, like your R code)
-        future = m.make_future_dataframe(periods=365)
-
-        # 5) Predict
-        forecast = m.predict(future)
-
-        # Ensure weekly/yearly columns exist (to mirror R safety)
-        if 'weekly' not in forecast.columns:
-            forecast['weekly'] = pd.NA
-        if 'yearly' not in forecast.columns:
-            forecast['yearly'] = pd.NA
-
-        # Add ID (Franchise) column
-        forecast['ID'] = fr_id
-
-        # Add an Index column similar to rownames in R
-        forecast = forecast.reset_index(drop=True)
-        forecast['Index'] = forecast.index
-
-        results.append(forecast)
+    # 2-5) Split by ID (Franchise); fit + predict each in its own process (independent, CPU-bound Stan fits).
+    # One Stan thread per fit so the workers don't oversubscribe the cores.
+    os.environ.setdefault('STAN_NUM_THREADS', '1')
+    if HAS_PYARROW:
+        PROPHET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    results = Parallel(n_jobs=PROPHET_N_JOBS, backend='loky')(
+        delayed(fit_forecast)(fr_id, df_group)
+        for fr_id, df_group in dataset.groupby('ID', observed=True, sort=False)
+    )
 
-    # 6) Combine all forecasts
-    all_forecasts = pd.concat(results, ignore_index=True)
+    # 6) Combine all forecasts (index: ID, ds)
+    all_forecasts = pd.concat(results).sort_index()
 
     # Optional: filter dates if you want to mimic the commented R line
-    # all_forecasts = all_forecasts[all_forecasts['ds'] < pd.to_datetime("2025-01-05")]
+    # all_forecasts = all_forecasts[all_forecasts.index.get_level_values('ds') < pd.to_datetime("2025-01-05")]
 
-    # 7) Merge original dataset with forecast (on ID + ds) and keep same columns as R
+    # 7) Join forecast onto original dataset (on the ID + ds index) and keep same columns as R
     merged_dataset = (
         dataset
-        .merge(
-            all_forecasts[['ID', 'ds', 'trend', 'weekly', 'yearly', 'yhat']],
-            on=['ID', 'ds'],
-            how='left'
-        )
+        .set_index(['ID', 'ds'])
+        .join(all_forecasts[['trend', 'weekly', 'yearly', 'yhat']], how='left')
+        .reset_index()
         [['ID', 'ds', 'y', 'trend', 'weekly', 'yearly', 'yhat']]
         .copy()
     )
@@ -381,21 +540,22 @@ if RUN_PROPHET_MODEL:
     # make ds a pure date (no time)
     merged_dataset['ds'] = pd.to_datetime(merged_dataset['ds']).dt.date
     # 9) Write to Excel
-    with pd.ExcelWriter(OUTPUT_PROPHET_OUT, engine='openpyxl') as writer4:
-        merged_dataset.to_excel(writer4, sheet_name='Prophet_Output', index=False)
+    prophet_out_paths = write_output(OUTPUT_PROPHET_OUT, {'Prophet_Output': merged_dataset})
 
-    print(f"✅ Prophet modeling complete. Output file: {OUTPUT_PROPHET_OUT}")
+    print(f"✅ Prophet modeling complete. Output file: {', '.join(map(str, prophet_out_paths))}")
 
 # =============================
 # Final prints
 # =============================
 print("✅ Files created:")
-print(f"   Main QA file:         {OUTPUT_XLSX}")
-print(f"   Analytical only file: {OUTPUT_ANALYTICAL}")
-if RUN_PROPHET_EXPORT:
-    print(f"   Prophet input file:   {OUTPUT_PROPHET_IN}")
-if RUN_PROPHET_MODEL:
-    print(f"   Prophet output file:  {OUTPUT_PROPHET_OUT}")
+for label, paths in [
+    ("Main QA file:", [OUTPUT_XLSX]),
+    ("Analytical only file:", analytical_paths),
+    ("Prophet input file:", prophet_in_paths),
+    ("Prophet output file:", prophet_out_paths),
+]:
+    for i, p in enumerate(paths):
+        print(f"   {label if i == 0 else '':<22}{p}")
 print(f"   Rows exported (included only): {len(df_out):,}")
 print(f"   Unique weeks (included only):  {df_out['Week'].nunique()}")
 